@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark full task re-planning against incremental (delta) re-planning.
+
+Compares the estimated prompt and completion tokens when one task is added to
+a plan of N tasks: a full re-plan resends every task and the model writes the
+whole plan again, a delta only covers the new task. Also times the local
+heuristic path that PATCH /taskplan/{user} runs. Runs offline: no
+GROQ_API_KEY or running server is needed.
+"""
+
+import os
+import json
+import sys
+import time
+import tempfile
+
+os.environ.setdefault("TASKPLAN_DB", os.path.join(tempfile.mkdtemp(), "bench_taskplans.db"))
+
+from taskplanner import build_task_messages, build_delta_messages, infer_task_details, apply_task_delta
+from planstore import save_plan
+from tokens import estimate_tokens, estimate_text_tokens
+
+SAMPLE_TASKS = [
+    "Prepare presentation", "Gym workout", "Buy groceries", "Study for exam",
+    "Reply to client email", "Pay electricity bill", "Read a chapter", "Yoga session",
+    "Clean the kitchen", "Review project report"
+]
+
+
+def make_plan(user_name, count):
+    tasks = [f"{SAMPLE_TASKS[i % len(SAMPLE_TASKS)]} {i + 1}" for i in range(count)]
+    return tasks, {
+        "user_name": user_name,
+        "date": "2025-10-23",
+        "tasks": [infer_task_details(t, "2025-10-23") for t in tasks],
+        "general_tips": ["Prioritize high-impact tasks first."]
+    }
+
+
+def bench_tokens(sizes):
+    """Prompt and completion tokens to add one task: full re-plan vs delta"""
+    print("Estimated tokens when adding 1 task (prompt + completion)")
+    print(f"{'tasks':>6} {'full in':>8} {'full out':>9} {'delta in':>9} {'delta out':>10} {'saved':>7}")
+    for n in sizes:
+        tasks, plan = make_plan("Bench", n)
+        new_task = "Call the bank"
+        new_entry = infer_task_details(new_task, "2025-10-23")
+
+        full_in = estimate_tokens(build_task_messages("Bench", tasks + [new_task]))
+        # A full re-plan makes the model write out every task again
+        full_out = estimate_text_tokens(json.dumps({**plan, "tasks": plan["tasks"] + [new_entry]}))
+        delta_in = estimate_tokens(build_delta_messages("Bench", [new_task], "2025-10-23"))
+        delta_out = estimate_text_tokens(json.dumps({"tasks": [new_entry]}))
+
+        full, delta = full_in + full_out, delta_in + delta_out
+        print(f"{n:>6} {full_in:>8} {full_out:>9} {delta_in:>9} {delta_out:>10} {100 * (full - delta) / full:>6.1f}%")
+
+
+def bench_local_update(sizes, iterations=200):
+    """Latency of a heuristic PATCH (plan new task, then merge in a BEGIN IMMEDIATE transaction)"""
+    print("\nLocal re-plan latency per edit (apply_task_delta, no model call)")
+    print(f"{'tasks':>6} {'ms/edit':>9}")
+    for n in sizes:
+        user_name = f"bench-{n}"
+        _, plan = make_plan(user_name, n)
+        elapsed = 0.0
+        for i in range(iterations):
+            # Start each edit from the same N-task plan so the row measures N tasks
+            save_plan(user_name, plan)
+            start = time.perf_counter()
+            apply_task_delta(
+                user_name,
+                added=["Buy milk"],
+                updated=[{"task_name": plan["tasks"][0]["task_name"], "status": "Completed"}],
+                use_llm=False
+            )
+            elapsed += time.perf_counter() - start
+        print(f"{n:>6} {elapsed * 1000 / iterations:>9.3f}")
+
+
+def main():
+    sizes = [int(s) for s in sys.argv[1:]] or [5, 10, 25, 50, 100]
+    print("EverydayAI Task Plan Benchmark")
+    print("=" * 40)
+    bench_tokens(sizes)
+    bench_local_update(sizes)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 from openai import OpenAI
 import os
+import re
 import logging
+import tracing
+from sessions import SessionStore
+from tokens import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -18,14 +22,7 @@ except Exception as e:
     logger.error(f"Failed to initialize OpenAI client in fitness module: {e}")
     client = None
 
-def generate_fitness_plan(user_age, user_weight, user_height, user_fitness_goal, user_fitness_level, user_available_days):
-    if not client:
-        raise Exception("OpenAI client is not available")
-    
-    try:
-        logger.info(f"Generating fitness plan for age: {user_age}, weight: {user_weight}")
-        
-        system_prompt = '''
+system_prompt = '''
 You are a world-class Fitness Coach and Personal Trainer. Generate **personalized weekly fitness and meal plans** in **JSON format**. 
 You may ask the user clarifying questions if any information is missing, but **do not finalize the plan until you have all necessary details**. 
 Once all info is provided, generate **three distinct variations** of weekly plans in JSON format.
@@ -57,32 +54,269 @@ Rules:
 - **Only output JSON at the final step**, after all clarifications are gathered.
 '''
 
-    user_prompt = f"""
+def generate_fitness_plan(user_age, user_weight, user_height, user_fitness_goal, user_fitness_level, user_available_days):
+    if not client:
+        raise Exception("OpenAI client is not available")
+    
+    try:
+        logger.info(f"Generating fitness plan for age: {user_age}, weight: {user_weight}")
+        
+        with tracing.span("prompt.build"):
+            user_prompt = f"""
 I am {user_age} years old, weigh {user_weight} kg, and am {user_height} cm tall. 
 My fitness goal is to {user_fitness_goal}. 
 My fitness level is {user_fitness_level}, and I can work out {user_available_days} days per week.
 Please ask any clarifying questions first if needed. After all information is provided, generate 3 variations of weekly fitness and meal plans in JSON format.
 """
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt}
-    ]
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ]
+
+        with tracing.span("llm.completion", model="openai/gpt-oss-20b"):
+            response = client.chat.completions.create(
+                model="openai/gpt-oss-20b",
+                messages=messages,
+                temperature=0.7,
+                max_tokens=2500
+            )
+
+        logger.info("Fitness plan generated successfully")
+        return response.choices[0].message.content
+        
+    except Exception as e:
+        logger.error(f"Error generating fitness plan: {str(e)}")
+        raise Exception(f"Failed to generate fitness plan: {str(e)}")
+
+FITNESS_CONTEXT_TOKENS = int(os.environ.get("FITNESS_CONTEXT_TOKENS", "3000"))
+MAX_AUTO_REPLIES = 2
+
+# Phrases in a clarifying question that the FitnessRequest fields already answer.
+# Each phrase names the field itself, so "goal weight" or "how often do you eat" do not match.
+PROFILE_QUESTIONS = [
+    (("how old are you", "your age"), "age", "I am {} years old."),
+    (("how much do you weigh", "your weight", "your current weight", "your body weight"), "weight", "I weigh {} kg."),
+    (("how tall", "your height"), "height", "I am {} cm tall."),
+    (("your fitness goal", "your main fitness goal", "your primary fitness goal"), "fitness_goal", "My fitness goal is to {}."),
+    (("your fitness level", "your current fitness level", "your experience level"), "fitness_level", "My fitness level is {}."),
+    (
+        ("how many days per week can you", "how many days a week can you", "how many days can you",
+         "how often can you work out", "how often can you train", "how often can you exercise"),
+        "available_days", "I can work out {} days per week."
+    ),
+]
+
+sessions = SessionStore()
+
+
+def is_final_plan(text):
+    return bool(text) and '"weekly_schedule"' in text
+
+
+def build_profile_prompt(profile):
+    return f"""
+I am {profile['age']} years old, weigh {profile['weight']} kg, and am {profile['height']} cm tall. 
+My fitness goal is to {profile['fitness_goal']}. 
+My fitness level is {profile['fitness_level']}, and I can work out {profile['available_days']} days per week.
+These details are complete, so do not ask about them again. Only ask a clarifying question if something essential is still missing (for example injuries or available equipment); otherwise assume sensible defaults and generate 3 variations of weekly fitness and meal plans in JSON format right away.
+"""
+
+
+def find_questions(text):
+    """Split a reply into its questions, ignoring markdown emphasis and list markers."""
+    questions = []
+    for line in re.sub(r"[*_`]", "", text).splitlines():
+        # A line may hold several questions ("How old are you? And how tall?")
+        for part in re.split(r"(?<=\?)", line):
+            part = part.strip(" -0123456789.)\t")
+            if part.endswith("?"):
+                # Keep only the question sentence, not any lead-in before it
+                questions.append(re.split(r"(?<=[.!:])\s+", part)[-1])
+    return questions
+
+
+def resolve_questions(text, profile):
+    """
+    Answer the model's clarifying questions from the profile where possible.
 
+    Returns (answers, unresolved) where unresolved are the questions only the user can answer.
+    """
+    answers, unresolved = [], []
+    for question in find_questions(text):
+        lowered = question.lower()
+        match = next((q for q in PROFILE_QUESTIONS if any(k in lowered for k in q[0])), None)
+        if match and profile.get(match[1]):
+            answer = match[2].format(profile[match[1]])
+            if answer not in answers:
+                answers.append(answer)
+        else:
+            unresolved.append(question)
+    return answers, unresolved
+
+
+def compact_messages(messages, budget=None):
+    """
+    Keep the conversation under the token budget.
+
+    The system prompt, the profile and the latest exchange are kept verbatim; older turns
+    are folded into one short summary of what the user said, since the model's earlier
+    questions are not needed once answered.
+    """
+    budget = budget or FITNESS_CONTEXT_TOKENS
+    if estimate_tokens(messages) <= budget or len(messages) <= 4:
+        return messages, False
+
+    head, middle, tail = messages[:2], messages[2:-2], messages[-2:]
+    notes = []
+    for m in middle:
+        if m["role"] == "user":
+            notes.append(m["content"].strip()[:300])
+        elif m["content"].startswith("Summary of earlier conversation"):
+            notes.append(m["content"].split("\n", 1)[-1].strip())
+    summary = "Summary of earlier conversation (user answers so far):\n" + "\n".join(f"- {n}" for n in notes if n)
+    compacted = head + [{"role": "system", "content": summary}] + tail
+
+    # Drop the oldest notes until the prompt fits or only the summary header is left
+    while estimate_tokens(compacted) > budget and notes:
+        notes.pop(0)
+        summary = "Summary of earlier conversation (user answers so far):\n" + "\n".join(f"- {n}" for n in notes if n)
+        compacted[2] = {"role": "system", "content": summary}
+    if not notes:
+        compacted.pop(2)
+    return compacted, True
+
+
+def _complete(session):
+    session["messages"], compacted = compact_messages(session["messages"])
+    if compacted:
+        session["compactions"] += 1
+
+    with tracing.span("llm.completion", model="openai/gpt-oss-20b", prompt_tokens_estimate=estimate_tokens(session["messages"])):
         response = client.chat.completions.create(
             model="openai/gpt-oss-20b",
-            messages=messages,
+            messages=session["messages"],
             temperature=0.7,
             max_tokens=2500
         )
 
-        logger.info("Fitness plan generated successfully")
-        return response.choices[0].message.content
-        
+    content = response.choices[0].message.content or ""
+    session["messages"].append({"role": "assistant", "content": content})
+    session["model_calls"] += 1
+    if response.usage:
+        session["usage"]["prompt_tokens"] += response.usage.prompt_tokens or 0
+        session["usage"]["completion_tokens"] += response.usage.completion_tokens or 0
+    return content
+
+
+def _run_turn(session, message=None):
+    """
+    Run one user turn on `session` (a copy loaded from the store), answering clarifying questions
+    locally until the plan is final or the user is needed.
+    """
+    session["turns"] += 1
+    if message is not None:
+        # Answers resolved locally on the previous turn go along with the user's reply
+        session["messages"].append({"role": "user", "content": " ".join(session["pending_answers"] + [message])})
+        session["pending_answers"] = []
+
+    content = _complete(session)
+    for _ in range(MAX_AUTO_REPLIES):
+        if is_final_plan(content):
+            break
+        answers, unresolved = resolve_questions(content, session["profile"])
+        session["local_answers"] += len(answers)
+        if unresolved or not answers:
+            # Keep what was resolved for the next user turn instead of asking again
+            session["pending_answers"] = answers
+            break
+        logger.info(f"Answered {len(answers)} clarifying questions locally")
+        session["messages"].append({
+            "role": "user",
+            "content": " ".join(answers) + " Please generate the final plans now."
+        })
+        content = _complete(session)
+
+    if is_final_plan(content) and session["turns_to_final"] is None:
+        session["turns_to_final"] = session["turns"]
+    return content
+
+
+def session_stats(session):
+    usage = session["usage"]
+    return {
+        "turns": session["turns"],
+        "model_calls": session["model_calls"],
+        "turns_to_final": session["turns_to_final"],
+        "local_answers": session["local_answers"],
+        "pending_answers": session["pending_answers"],
+        "compactions": session["compactions"],
+        "usage": {**usage, "total_tokens": usage["prompt_tokens"] + usage["completion_tokens"]}
+    }
+
+
+def start_fitness_session(user_age, user_weight, user_height, user_fitness_goal, user_fitness_level, user_available_days):
+    """Start a multi-turn fitness session. Returns (session_id, reply, final, stats)."""
+    if not client:
+        raise Exception("OpenAI client is not available")
+
+    try:
+        profile = {
+            "age": user_age,
+            "weight": user_weight,
+            "height": user_height,
+            "fitness_goal": user_fitness_goal,
+            "fitness_level": user_fitness_level,
+            "available_days": user_available_days
+        }
+        with tracing.span("prompt.build"):
+            session = {
+                "profile": profile,
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": build_profile_prompt(profile)}
+                ],
+                "turns": 0,
+                "model_calls": 0,
+                "turns_to_final": None,
+                "local_answers": 0,
+                "pending_answers": [],
+                "compactions": 0,
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0}
+            }
+
+        reply = _run_turn(session)
+        session_id = sessions.create(session)
+        logger.info(f"Started fitness session {session_id}, final: {is_final_plan(reply)}")
+        return session_id, reply, is_final_plan(reply), session_stats(session)
+
     except Exception as e:
-        logger.error(f"Error generating fitness plan: {str(e)}")
+        logger.error(f"Error starting fitness session: {str(e)}")
         raise Exception(f"Failed to generate fitness plan: {str(e)}")
 
+
+def continue_fitness_session(session_id, message):
+    """
+    Send the user's follow-up to an existing session. Returns (reply, final, stats),
+    or None if the session is unknown. Raises SessionBusyError if a turn is already running.
+    """
+    if not client:
+        raise Exception("OpenAI client is not available")
+
+    # The leased session is a copy; it is only written back once the turn succeeds
+    with sessions.lease(session_id) as session:
+        if session is None:
+            return None
+        try:
+            reply = _run_turn(session, message)
+            sessions.put(session_id, session)
+            logger.info(f"Fitness session {session_id} turn {session['turns']}, final: {is_final_plan(reply)}")
+            return reply, is_final_plan(reply), session_stats(session)
+
+        except Exception as e:
+            logger.error(f"Error continuing fitness session: {str(e)}")
+            raise Exception(f"Failed to continue fitness session: {str(e)}")
+
 if __name__ == "__main__":
     user_age = input("Enter your age: ")
     user_weight = input("Enter your weight (in kg): ")
@@ -1,15 +1,21 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 import os
+import json
+import hmac
+import asyncio
 import logging
 import traceback
 from datetime import datetime
 from openai import OpenAI
+import tracing
+from sessions import SessionBusyError
 
 logging.basicConfig(level=logging.INFO)
+tracing.setup_queue_logging(logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
@@ -31,10 +37,29 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allow all origins
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],
 )
 
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    with tracing.span(
+        "http.request",
+        traceparent=request.headers.get("traceparent"),
+        **{"http.method": request.method}
+    ) as span:
+        request.state.traceparent = span.traceparent
+        response = await call_next(request)
+        # Record the route template, never the raw path: it holds user names and session ids
+        route = request.scope.get("route")
+        span.set_attribute("http.route", getattr(route, "path", "unmatched"))
+        span.set_attribute("http.status_code", response.status_code)
+        response.headers["traceparent"] = span.traceparent
+        return response
+
+
 try:
     groq_api_key = os.environ.get("GROQ_API_KEY")
     if not groq_api_key:
@@ -55,6 +80,10 @@ class FitnessRequest(BaseModel):
     available_days: str
 
 
+class FitnessMessage(BaseModel):
+    message: str
+
+
 class RecipeRequest(BaseModel):
     query: str
 
@@ -64,10 +93,28 @@ class TaskRequest(BaseModel):
     tasks: List[str]
 
 
+class TaskUpdate(BaseModel):
+    task_name: str
+    priority: Optional[str] = None
+    deadline: Optional[str] = None
+    duration: Optional[str] = None
+    category: Optional[str] = None
+    notes: Optional[str] = None
+    status: Optional[str] = None
+
+
+class TaskPatchRequest(BaseModel):
+    added: List[str] = []
+    removed: List[str] = []
+    updated: List[TaskUpdate] = []
+    use_llm: bool = True
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Global exception: {str(exc)}")
-    logger.error(f"Traceback: {traceback.format_exc()}")
+    with tracing.span("error.format", traceparent=getattr(request.state, "traceparent", None)):
+        logger.error(f"Global exception: {str(exc)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
     return JSONResponse(status_code=500, content={"error": "Internal server error"})
 
 
@@ -101,22 +148,57 @@ def fitness_plan(req: FitnessRequest):
     try:
         if not client:
             raise HTTPException(status_code=503, detail="AI service unavailable")
-        from fitness import generate_fitness_plan
-        result = generate_fitness_plan(
+        with tracing.span("import", module="fitness"):
+            from fitness import start_fitness_session
+        session_id, result, final, stats = start_fitness_session(
             req.age, req.weight, req.height, req.fitness_goal, req.fitness_level, req.available_days
         )
-        return {"result": result, "timestamp": datetime.utcnow().isoformat()}
+        return {
+            "result": result,
+            "session_id": session_id,
+            "final": final,
+            "session": stats,
+            "timestamp": datetime.utcnow().isoformat()
+        }
     except Exception as e:
         logger.error(f"Fitness plan error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate fitness plan: {str(e)}")
 
 
+@app.post("/fitness/{session_id}")
+def fitness_followup(session_id: str, req: FitnessMessage):
+    try:
+        if not client:
+            raise HTTPException(status_code=503, detail="AI service unavailable")
+        with tracing.span("import", module="fitness"):
+            from fitness import continue_fitness_session
+        reply = continue_fitness_session(session_id, req.message)
+        if reply is None:
+            raise HTTPException(status_code=404, detail="Fitness session not found or expired, POST /fitness to start a new one")
+        result, final, stats = reply
+        return {
+            "result": result,
+            "session_id": session_id,
+            "final": final,
+            "session": stats,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    except HTTPException:
+        raise
+    except SessionBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Fitness follow-up error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to continue fitness session: {str(e)}")
+
+
 @app.post("/recipe")
 def recipe(req: RecipeRequest):
     try:
         if not client:
             raise HTTPException(status_code=503, detail="AI service unavailable")
-        from recipie import generate_recipe
+        with tracing.span("import", module="recipie"):
+            from recipie import generate_recipe
         result = generate_recipe(req.query)
         return {"result": result, "timestamp": datetime.utcnow().isoformat()}
     except Exception as e:
@@ -129,17 +211,67 @@ def task_plan(req: TaskRequest):
     try:
         if not client:
             raise HTTPException(status_code=503, detail="AI service unavailable")
-        from taskplanner import generate_task_plan
+        with tracing.span("import", module="taskplanner"):
+            from taskplanner import generate_task_plan, parse_task_plan
+            from planstore import save_plan
         result = generate_task_plan(req.user_name, req.tasks)
+        plan = parse_task_plan(result)
+        if plan is not None:
+            try:
+                save_plan(req.user_name, plan)
+            except Exception as e:
+                logger.error(f"Task plan for {req.user_name} generated but not stored: {str(e)}")
+        else:
+            logger.warning(f"Task plan for {req.user_name} is not valid JSON, not stored")
         return {"result": result, "timestamp": datetime.utcnow().isoformat()}
     except Exception as e:
         logger.error(f"Task plan error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate task plan: {str(e)}")
 
 
+@app.patch("/taskplan/{user}")
+def task_plan_update(user: str, req: TaskPatchRequest):
+    try:
+        with tracing.span("import", module="taskplanner"):
+            from taskplanner import apply_task_delta
+        updated = [u.model_dump(exclude_none=True) for u in req.updated]
+        merged = apply_task_delta(user, req.added, req.removed, updated, req.use_llm and client is not None)
+        if merged is None:
+            raise HTTPException(status_code=404, detail=f"No stored task plan for {user}, POST /taskplan first")
+        plan, stats = merged
+        return {"result": json.dumps(plan), "delta": stats, "timestamp": datetime.utcnow().isoformat()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Task plan update error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to update task plan: {str(e)}")
+
+
+@app.get("/admin/profile")
+async def admin_profile(request: Request, seconds: float = 10.0, interval: float = 0.01):
+    admin_token = os.environ.get("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", "").encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    from profiler import sample_stacks, to_collapsed, MAX_PROFILE_SECONDS
+    if not 0 < seconds <= MAX_PROFILE_SECONDS or not 0.001 <= interval <= 1.0:
+        raise HTTPException(
+            status_code=400,
+            detail=f"seconds must be in (0, {MAX_PROFILE_SECONDS}] and interval in [0.001, 1.0]"
+        )
+    try:
+        stacks = await asyncio.to_thread(sample_stacks, seconds, interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(to_collapsed(stacks))
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # log_config=None keeps uvicorn from installing its own synchronous handlers; its loggers propagate to the queued root
+    uvicorn.run(app, host="0.0.0.0", port=port, log_config=None)
 
 
@@ -0,0 +1,84 @@
+import os
+import json
+import sqlite3
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+TASKPLAN_DB = os.environ.get("TASKPLAN_DB", "taskplans.db")
+
+
+def _connect():
+    # One short-lived connection per call: safe across threadpool threads and gunicorn workers
+    conn = sqlite3.connect(TASKPLAN_DB, timeout=10)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS task_plans ("
+        "user_name TEXT PRIMARY KEY, plan TEXT NOT NULL, updated_at TEXT NOT NULL)"
+    )
+    return conn
+
+
+def load_plan(user_name):
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT plan FROM task_plans WHERE user_name = ?", (user_name,)).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"Failed to load task plan for {user_name}: {e}")
+        raise Exception(f"Failed to load task plan: {str(e)}")
+    return json.loads(row[0]) if row else None
+
+
+def update_plan(user_name, update):
+    """
+    Read-modify-write a stored plan in one BEGIN IMMEDIATE transaction.
+
+    `update(plan)` must return (new_plan, result) and should be quick, since the
+    database is write-locked while it runs. Returns (new_plan, result), or None
+    if the user has no stored plan.
+    """
+    try:
+        conn = _connect()
+        conn.isolation_level = None  # Manage the transaction explicitly
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT plan FROM task_plans WHERE user_name = ?", (user_name,)).fetchone()
+                if row is None:
+                    conn.execute("ROLLBACK")
+                    return None
+                plan, result = update(json.loads(row[0]))
+                conn.execute(
+                    "UPDATE task_plans SET plan = ?, updated_at = ? WHERE user_name = ?",
+                    (json.dumps(plan), datetime.utcnow().isoformat(), user_name)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"Failed to update task plan for {user_name}: {e}")
+        raise Exception(f"Failed to update task plan: {str(e)}")
+    return plan, result
+
+
+def save_plan(user_name, plan):
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO task_plans (user_name, plan, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_name) DO UPDATE SET plan = excluded.plan, updated_at = excluded.updated_at",
+                    (user_name, json.dumps(plan), datetime.utcnow().isoformat())
+                )
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"Failed to save task plan for {user_name}: {e}")
+        raise Exception(f"Failed to save task plan: {str(e)}")
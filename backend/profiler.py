@@ -0,0 +1,55 @@
+import sys
+import time
+import threading
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+MAX_PROFILE_SECONDS = 60
+
+_profile_lock = threading.Lock()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{frame.f_lineno})"
+
+
+def sample_stacks(duration, interval=0.01):
+    """
+    Sample the stacks of every thread in this process for `duration` seconds.
+
+    Returns a Counter mapping collapsed stacks ("outer;...;inner") to sample counts,
+    the format consumed by flamegraph.pl and speedscope.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running on this worker")
+
+    try:
+        own_thread = threading.get_ident()
+        stacks = Counter()
+        deadline = time.monotonic() + duration
+
+        while time.monotonic() < deadline:
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                name = thread_names.get(thread_id, str(thread_id))
+                labels.append(f"thread:{name}")
+                stacks[";".join(reversed(labels))] += 1
+            time.sleep(interval)
+
+        logger.info(f"Profile finished: {sum(stacks.values())} samples, {len(stacks)} unique stacks")
+        return stacks
+    finally:
+        _profile_lock.release()
+
+
+def to_collapsed(stacks):
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
@@ -1,6 +1,7 @@
 from openai import OpenAI
 import os
 import logging
+import tracing
 
 logger = logging.getLogger(__name__)
 
@@ -119,15 +120,17 @@ def generate_recipe(user_input):
     try:
         logger.info(f"Generating recipe for query: {user_input[:50]}...")
         
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_input}
-        ]
-
-        response = client.chat.completions.create(
-            model="openai/gpt-oss-20b",
-            messages=messages,
-        )
+        with tracing.span("prompt.build"):
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_input}
+            ]
+
+        with tracing.span("llm.completion", model="openai/gpt-oss-20b"):
+            response = client.chat.completions.create(
+                model="openai/gpt-oss-20b",
+                messages=messages,
+            )
 
         logger.info("Recipe generated successfully")
         return response.choices[0].message.content
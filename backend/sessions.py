@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+from contextlib import contextmanager
+from planstore import TASKPLAN_DB
+
+logger = logging.getLogger(__name__)
+
+FITNESS_SESSION_DB = os.environ.get("FITNESS_SESSION_DB", TASKPLAN_DB)
+FITNESS_SESSION_MAX = int(os.environ.get("FITNESS_SESSION_MAX", "500"))
+FITNESS_SESSION_TTL = int(os.environ.get("FITNESS_SESSION_TTL", "1800"))
+# A lease left by a crashed worker stops blocking the session after this many seconds
+FITNESS_SESSION_LEASE = int(os.environ.get("FITNESS_SESSION_LEASE", "300"))
+
+
+class SessionBusyError(Exception):
+    """Raised when a session already has a turn in progress."""
+
+
+class SessionStore:
+    """
+    Conversation store in SQLite, shared by every worker process, with an idle TTL
+    and LRU trimming on write. Sessions are returned as fresh copies.
+    """
+
+    def __init__(self, path=None, max_sessions=FITNESS_SESSION_MAX, ttl=FITNESS_SESSION_TTL,
+                 lease_timeout=FITNESS_SESSION_LEASE):
+        self.path = path or FITNESS_SESSION_DB
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.lease_timeout = lease_timeout
+
+    @contextmanager
+    def _transaction(self):
+        # One short-lived connection per call, like planstore; BEGIN IMMEDIATE serializes writers
+        try:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.isolation_level = None  # Manage the transaction explicitly
+            try:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS fitness_sessions ("
+                    "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                    "touched_at REAL NOT NULL, busy_until REAL NOT NULL DEFAULT 0)"
+                )
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield conn
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Fitness session store error: {e}")
+            raise Exception(f"Fitness session store error: {str(e)}")
+
+    def _expire(self, conn, now):
+        expired = conn.execute(
+            "DELETE FROM fitness_sessions WHERE touched_at < ? AND busy_until < ?", (now - self.ttl, now)
+        ).rowcount
+        if expired:
+            logger.info(f"{expired} fitness sessions expired")
+
+    def create(self, session):
+        session_id = uuid.uuid4().hex
+        self.put(session_id, session)
+        return session_id
+
+    def get(self, session_id):
+        now = time.time()
+        with self._transaction() as conn:
+            self._expire(conn, now)
+            row = conn.execute(
+                "SELECT data FROM fitness_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE fitness_sessions SET touched_at = ? WHERE session_id = ?", (now, session_id))
+        return json.loads(row[0])
+
+    def put(self, session_id, session):
+        now = time.time()
+        with self._transaction() as conn:
+            self._expire(conn, now)
+            # busy_until is left alone so a put inside a lease keeps the lease
+            conn.execute(
+                "INSERT INTO fitness_sessions (session_id, data, touched_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET data = excluded.data, touched_at = excluded.touched_at",
+                (session_id, json.dumps(session), now)
+            )
+            evicted = conn.execute(
+                "DELETE FROM fitness_sessions WHERE busy_until < ? AND session_id IN ("
+                "SELECT session_id FROM fitness_sessions ORDER BY touched_at DESC LIMIT -1 OFFSET ?)",
+                (now, self.max_sessions)
+            ).rowcount
+            if evicted:
+                logger.info(f"{evicted} fitness sessions evicted")
+
+    @contextmanager
+    def lease(self, session_id):
+        """
+        Hold a session for one turn across all workers. Yields the session (or None if
+        unknown) and raises SessionBusyError if another turn on it has not finished.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            self._expire(conn, now)
+            row = conn.execute(
+                "SELECT data, busy_until FROM fitness_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is not None and row[1] <= now:
+                conn.execute(
+                    "UPDATE fitness_sessions SET busy_until = ?, touched_at = ? WHERE session_id = ?",
+                    (now + self.lease_timeout, now, session_id)
+                )
+        if row is None:
+            yield None
+            return
+        if row[1] > now:
+            raise SessionBusyError(f"Session {session_id} already has a turn in progress")
+
+        try:
+            yield json.loads(row[0])
+        finally:
+            with self._transaction() as conn:
+                conn.execute("UPDATE fitness_sessions SET busy_until = 0 WHERE session_id = ?", (session_id,))
+
+    def delete(self, session_id):
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM fitness_sessions WHERE session_id = ?", (session_id,)).rowcount > 0
+
+    def __len__(self):
+        with self._transaction() as conn:
+            return conn.execute("SELECT COUNT(*) FROM fitness_sessions").fetchone()[0]
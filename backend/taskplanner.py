@@ -2,6 +2,9 @@ from openai import OpenAI
 import os
 import json
 import logging
+import tracing
+from datetime import datetime
+from planstore import load_plan, update_plan
 
 logger = logging.getLogger(__name__)
 
@@ -66,6 +69,13 @@ Examples:
 Always generate task plans in the same JSON format.
 '''
 
+def build_task_messages(user_name, tasks):
+    user_input = f"User: My name is {user_name}. I have tasks: {', '.join(tasks)}"
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_input}
+    ]
+
 def generate_task_plan(user_name, tasks):
     if not client:
         raise Exception("OpenAI client is not available")
@@ -73,19 +83,16 @@ def generate_task_plan(user_name, tasks):
     try:
         logger.info(f"Generating task plan for user: {user_name}, tasks: {len(tasks)}")
         
-        user_input = f"User: My name is {user_name}. I have tasks: {', '.join(tasks)}"
+        with tracing.span("prompt.build", task_count=len(tasks)):
+            messages = build_task_messages(user_name, tasks)
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_input}
-        ]
-
-        response = client.chat.completions.create(
-            model="openai/gpt-oss-20b",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=1500
-        )
+        with tracing.span("llm.completion", model="openai/gpt-oss-20b"):
+            response = client.chat.completions.create(
+                model="openai/gpt-oss-20b",
+                messages=messages,
+                temperature=0.7,
+                max_tokens=1500
+            )
 
         logger.info("Task plan generated successfully")
         return response.choices[0].message.content
@@ -94,6 +101,232 @@ def generate_task_plan(user_name, tasks):
         logger.error(f"Error generating task plan: {str(e)}")
         raise Exception(f"Failed to generate task plan: {str(e)}")
 
+delta_system_prompt = '''
+You are an expert Task Planner updating an existing task plan. Only plan the NEW tasks listed by the user; the rest of the plan is already done and must not be repeated. Output must always be in **JSON format**.
+
+JSON Format:
+{
+  "tasks": [
+    {
+      "task_name": "string",
+      "priority": "High / Medium / Low",
+      "deadline": "YYYY-MM-DD or time",
+      "duration": "estimated time in minutes or hours",
+      "category": "Work / Study / Personal / Fitness / Other",
+      "notes": "optional",
+      "status": "Pending"
+    }
+  ]
+}
+
+Rules:
+1. Return exactly one entry per new task, keeping the task name as given.
+2. Infer priority, deadline, duration and category intelligently.
+3. Do not include explanations outside the JSON.
+'''
+
+CATEGORY_KEYWORDS = {
+    "Work": ["presentation", "meeting", "report", "email", "client", "project", "deploy", "review", "slides", "call with"],
+    "Study": ["study", "read", "exam", "course", "homework", "assignment", "learn", "revise", "lecture"],
+    "Fitness": ["gym", "workout", "run", "yoga", "walk", "exercise", "swim", "cycle", "stretch"],
+    "Personal": ["buy", "groceries", "clean", "laundry", "pay", "bill", "doctor", "cook", "call", "shopping"],
+}
+HIGH_PRIORITY_KEYWORDS = ["urgent", "asap", "deadline", "exam", "presentation", "report", "pay", "bill", "submit"]
+LOW_PRIORITY_KEYWORDS = ["optional", "someday", "maybe", "if time"]
+CATEGORY_DURATIONS = {"Work": "1 hour", "Study": "1 hour", "Fitness": "1 hour", "Personal": "30 minutes", "Other": "30 minutes"}
+TASK_FIELDS = ["priority", "deadline", "duration", "category", "notes", "status"]
+
+
+def _task_name(task):
+    if isinstance(task, dict) and isinstance(task.get("task_name"), str):
+        return task["task_name"]
+    return None
+
+
+def _valid_tasks(plan):
+    """Task entries that are dicts with a string task_name; anything else is skipped."""
+    tasks = plan.get("tasks")
+    if not isinstance(tasks, list):
+        return []
+    return [t for t in tasks if _task_name(t) is not None]
+
+
+def parse_task_plan(text):
+    """
+    Extract the JSON plan from a model reply, or return None if it has none.
+
+    The plan must have a "tasks" list; entries without a string task_name are dropped.
+    """
+    if not text:
+        return None
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        plan = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(plan, dict) or not isinstance(plan.get("tasks"), list):
+        return None
+    plan["tasks"] = _valid_tasks(plan)
+    return plan
+
+
+def infer_task_details(task_name, date=None):
+    """Plan a single task locally from keywords, without calling the model."""
+    name = task_name.lower()
+    category = next(
+        (c for c, words in CATEGORY_KEYWORDS.items() if any(w in name for w in words)), "Other"
+    )
+    if any(w in name for w in HIGH_PRIORITY_KEYWORDS):
+        priority = "High"
+    elif any(w in name for w in LOW_PRIORITY_KEYWORDS):
+        priority = "Low"
+    else:
+        priority = "Medium"
+    return {
+        "task_name": task_name,
+        "priority": priority,
+        "deadline": date or datetime.now().date().isoformat(),
+        "duration": CATEGORY_DURATIONS[category],
+        "category": category,
+        "notes": "",
+        "status": "Pending"
+    }
+
+
+def build_delta_messages(user_name, added, date):
+    user_input = f"User: My name is {user_name}. Today is {date}. New tasks: {', '.join(added)}"
+    return [
+        {"role": "system", "content": delta_system_prompt},
+        {"role": "user", "content": user_input}
+    ]
+
+
+def _call_delta_model(user_name, added, date):
+    with tracing.span("prompt.build", task_count=len(added)):
+        messages = build_delta_messages(user_name, added, date)
+
+    with tracing.span("llm.completion", model="openai/gpt-oss-20b"):
+        response = client.chat.completions.create(
+            model="openai/gpt-oss-20b",
+            messages=messages,
+            temperature=0.7,
+            max_tokens=200 + 150 * len(added)
+        )
+
+    delta = parse_task_plan(response.choices[0].message.content) or {}
+    planned = {_task_name(t).lower(): t for t in _valid_tasks(delta)}
+    usage = {
+        "prompt_tokens": getattr(response.usage, "prompt_tokens", None),
+        "completion_tokens": getattr(response.usage, "completion_tokens", None)
+    }
+    return planned, usage
+
+
+def plan_added_tasks(user_name, added, use_llm=True, existing=()):
+    """
+    Plan only the added tasks, skipping duplicates and names in `existing` (case-insensitive).
+
+    Returns (tasks, usage); usage is None when no model call was made.
+    """
+    date = datetime.now().date().isoformat()
+    seen = {name.lower() for name in existing}
+    new_names = []
+    for name in added:
+        if name.lower() not in seen:
+            seen.add(name.lower())
+            new_names.append(name)
+    if not new_names:
+        return [], None
+
+    planned, usage = {}, None
+    if use_llm and client:
+        try:
+            planned, usage = _call_delta_model(user_name, new_names, date)
+        except Exception as e:
+            logger.error(f"Delta task planning failed, falling back to heuristics: {str(e)}")
+
+    tasks = []
+    for task_name in new_names:
+        task = infer_task_details(task_name, date)
+        task.update({k: v for k, v in planned.get(task_name.lower(), {}).items() if k in TASK_FIELDS})
+        tasks.append(task)
+    return tasks, usage
+
+
+def merge_task_delta(user_name, plan, new_tasks=None, removed=None, updated=None, usage=None):
+    """
+    Merge planned new tasks, removals and updates into a plan without calling the model.
+
+    `updated` is a list of dicts with a "task_name" and the fields to change.
+    The input plan is not modified. Returns (plan, stats).
+    """
+    new_tasks = new_tasks or []
+    removed = removed or []
+    updated = updated or []
+
+    removed_names = {name.lower() for name in removed}
+    original = _valid_tasks(plan)
+    tasks = [dict(t) for t in original if _task_name(t).lower() not in removed_names]
+
+    by_name = {_task_name(t).lower(): t for t in tasks}
+    missing = []
+    for change in updated:
+        task = by_name.get((change.get("task_name") or "").lower())
+        if task is None:
+            missing.append(change.get("task_name"))
+            continue
+        task.update({k: v for k, v in change.items() if k in TASK_FIELDS and v is not None})
+
+    # Another edit may have added the same task since it was planned
+    added = [dict(t) for t in new_tasks if t["task_name"].lower() not in by_name]
+    tasks.extend(added)
+
+    merged = dict(plan)
+    merged["user_name"] = user_name
+    merged["date"] = datetime.now().date().isoformat()
+    merged["tasks"] = tasks
+    stats = {
+        "added": len(added),
+        "removed": len(original) + len(added) - len(tasks),
+        "updated": len(updated) - len(missing),
+        "not_found": missing,
+        "llm_used": usage is not None,
+        "usage": usage
+    }
+    return merged, stats
+
+
+def existing_task_names(plan, removed=None):
+    """Task names that stay in the plan after `removed`, used to skip re-planning them"""
+    removed_names = {name.lower() for name in removed or []}
+    names = [_task_name(t) for t in _valid_tasks(plan)]
+    return [name for name in names if name.lower() not in removed_names]
+
+
+def apply_task_delta(user_name, added=None, removed=None, updated=None, use_llm=True):
+    """
+    Apply a task delta to the user's stored plan, only planning the added tasks.
+
+    The new tasks are planned first, so the model call does not hold the database lock,
+    then merged into the latest stored plan in one transaction.
+    Returns (plan, stats), or None if the user has no stored plan.
+    """
+    added = added or []
+    logger.info(
+        f"Updating task plan for user: {user_name}, added: {len(added)}, "
+        f"removed: {len(removed or [])}, updated: {len(updated or [])}"
+    )
+    plan = load_plan(user_name)
+    if plan is None:
+        return None
+    new_tasks, usage = plan_added_tasks(user_name, added, use_llm, existing_task_names(plan, removed))
+    return update_plan(
+        user_name, lambda latest: merge_task_delta(user_name, latest, new_tasks, removed, updated, usage)
+    )
+
+
 if __name__ == "__main__":
     user_name = input("Enter your name: ")
     print("Enter your tasks one by one. Type 'done' when finished.")
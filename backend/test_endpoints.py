@@ -6,6 +6,7 @@ Run this after starting the server locally.
 
 import requests
 import json
+import os
 import sys
 
 # Base URL for the API
@@ -62,6 +63,50 @@ def test_fitness_endpoint():
     
     return True
 
+def test_fitness_session_endpoint():
+    """Test continuing a fitness session"""
+    print("\nTesting fitness session endpoint...")
+    
+    test_data = {
+        "age": "25",
+        "weight": "70",
+        "height": "175",
+        "fitness_goal": "lose weight",
+        "fitness_level": "beginner",
+        "available_days": "3"
+    }
+    
+    try:
+        response = requests.post(f"{BASE_URL}/fitness", json=test_data)
+        if response.status_code != 200:
+            print(f"  Error starting session: {response.text}")
+            return True
+        result = response.json()
+        session_id = result["session_id"]
+        print(f"✓ Fitness session started: final={result['final']}, session={result['session']}")
+        
+        if not result["final"]:
+            response = requests.post(
+                f"{BASE_URL}/fitness/{session_id}",
+                json={"message": "No injuries, I have dumbbells at home. Please generate the plans."}
+            )
+            print(f"✓ Fitness session follow-up: {response.status_code}")
+            if response.status_code == 200:
+                result = response.json()
+                print(f"  Final: {result['final']}, session: {result['session']}")
+            else:
+                print(f"  Error: {response.text}")
+        
+        response = requests.post(f"{BASE_URL}/fitness/no-such-session", json={"message": "hello"})
+        print(f"✓ Fitness follow-up for unknown session: {response.status_code}")
+        if response.status_code != 404:
+            return False
+    except Exception as e:
+        print(f"✗ Fitness session endpoint failed: {e}")
+        return False
+    
+    return True
+
 def test_recipe_endpoint():
     """Test recipe generation endpoint"""
     print("\nTesting recipe endpoint...")
@@ -107,11 +152,284 @@ def test_taskplan_endpoint():
     
     return True
 
+def test_taskplan_patch_endpoint():
+    """Test incremental task plan updates (uses the plan stored by test_taskplan_endpoint)"""
+    print("\nTesting taskplan patch endpoint...")
+    
+    test_data = {
+        "added": ["Call the bank"],
+        "removed": ["Buy groceries"],
+        "updated": [{"task_name": "Gym workout", "status": "Completed"}],
+        "use_llm": False
+    }
+    
+    try:
+        response = requests.patch(f"{BASE_URL}/taskplan/Test User", json=test_data)
+        print(f"✓ Taskplan patch endpoint: {response.status_code}")
+        if response.status_code == 200:
+            result = response.json()
+            tasks = {t["task_name"]: t for t in json.loads(result["result"])["tasks"]}
+            print(f"  Delta: {result['delta']}")
+            print(f"  Added task stored: {'Call the bank' in tasks}")
+            print(f"  Removed task gone: {'Buy groceries' not in tasks}")
+        else:
+            print(f"  Error: {response.text}")
+        
+        response = requests.patch(f"{BASE_URL}/taskplan/No Such User", json=test_data)
+        print(f"✓ Taskplan patch for unknown user: {response.status_code}")
+        if response.status_code != 404:
+            return False
+    except Exception as e:
+        print(f"✗ Taskplan patch endpoint failed: {e}")
+        return False
+    
+    return True
+
+def test_admin_profile_endpoint():
+    """Test the admin profiling endpoint (needs ADMIN_TOKEN set for the server and this script)"""
+    print("\nTesting admin profile endpoint...")
+    
+    admin_token = os.environ.get("ADMIN_TOKEN")
+    try:
+        response = requests.get(f"{BASE_URL}/admin/profile", params={"seconds": 1})
+        if response.status_code not in (403, 404):
+            print(f"✗ Admin profile without token: {response.status_code}")
+            return False
+        print(f"✓ Admin profile without token rejected: {response.status_code}")
+        
+        if not admin_token:
+            print("  ADMIN_TOKEN not set, skipping authorized profile")
+            return True
+        
+        response = requests.get(
+            f"{BASE_URL}/admin/profile",
+            params={"seconds": 1},
+            headers={"X-Admin-Token": admin_token}
+        )
+        print(f"✓ Admin profile endpoint: {response.status_code}")
+        if response.status_code != 200 or not response.text.strip():
+            print(f"  Error: {response.text}")
+            return False
+        print(f"  Collapsed stacks: {len(response.text.splitlines())}")
+    except Exception as e:
+        print(f"✗ Admin profile endpoint failed: {e}")
+        return False
+    
+    return True
+
+def test_traceparent_header():
+    """Test that responses carry a traceparent continuing the incoming trace"""
+    print("\nTesting traceparent propagation...")
+    
+    incoming = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    try:
+        response = requests.get(f"{BASE_URL}/health", headers={"traceparent": incoming})
+        traceparent = response.headers.get("traceparent", "")
+        print(f"✓ Traceparent header: {traceparent}")
+        if not traceparent.startswith("00-4bf92f3577b34da6a3ce929d0e0e4736-"):
+            print("  Error: trace id was not propagated")
+            return False
+    except Exception as e:
+        print(f"✗ Traceparent propagation failed: {e}")
+        return False
+    
+    return True
+
+def check_parse_traceparent():
+    """Check W3C traceparent parsing"""
+    print("\nChecking traceparent parsing...")
+    
+    from tracing import parse_traceparent
+    
+    trace_id, span_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+    cases = [
+        (f"00-{trace_id}-{span_id}-01", (trace_id, span_id, True)),
+        (f"00-{trace_id}-{span_id}-00", (trace_id, span_id, False)),
+        (f"00-{trace_id}-{span_id}-01-extra", None),
+        (f"01-{trace_id}-{span_id}-01-extra", (trace_id, span_id, True)),
+        (f"ff-{trace_id}-{span_id}-01", None),
+        (f"00-{'0' * 32}-{span_id}-01", None),
+        (f"00-{trace_id}-{'0' * 16}-01", None),
+        ("00-xyz-abc-01", None),
+        ("", None),
+    ]
+    failed = [header for header, expected in cases if parse_traceparent(header) != expected]
+    for header in failed:
+        print(f"✗ Unexpected result for {header!r}: {parse_traceparent(header)}")
+    if not failed:
+        print(f"✓ Traceparent parsing: {len(cases)} cases")
+    return not failed
+
+def check_update_task_plan():
+    """Check merging a task delta with local heuristics"""
+    print("\nChecking task plan updates...")
+    
+    from taskplanner import existing_task_names, plan_added_tasks, merge_task_delta, parse_task_plan
+    
+    plan = {
+        "user_name": "Test User",
+        "tasks": [
+            {"task_name": "Gym workout", "status": "Pending"},
+            {"task_name": "Buy groceries", "status": "Pending"}
+        ],
+        "general_tips": ["Start early."]
+    }
+    removed = ["buy groceries"]
+    new_tasks, usage = plan_added_tasks(
+        "Test User", ["Pay rent", "pay rent", "Gym workout"], False, existing_task_names(plan, removed)
+    )
+    merged, stats = merge_task_delta(
+        "Test User", plan, new_tasks, removed,
+        [{"task_name": "gym workout", "status": "Completed"}, {"task_name": "Missing"}], usage
+    )
+    names = [t["task_name"] for t in merged["tasks"]]
+    
+    # Malformed stored plans must not break later edits
+    bad_plan = {"tasks": ["oops", {"task_name": None}, {"task_name": "Read"}]}
+    bad_merged, _ = merge_task_delta("Test User", bad_plan, new_tasks, [], [{"task_name": None}])
+    parsed = parse_task_plan('Plan: {"tasks": [{"task_name": "Read"}, "oops", {"task_name": 3}]}')
+    checks = [
+        ("duplicates and existing tasks are not added", names == ["Gym workout", "Pay rent"]),
+        ("stats count one added task", stats["added"] == 1 and stats["removed"] == 1 and stats["updated"] == 1),
+        ("unknown updates are reported", stats["not_found"] == ["Missing"]),
+        ("update is applied", merged["tasks"][0]["status"] == "Completed"),
+        ("input plan is unchanged", plan["tasks"][0]["status"] == "Pending" and len(plan["tasks"]) == 2),
+        ("tips are kept", merged["general_tips"] == ["Start early."]),
+        ("no model call", stats["llm_used"] is False),
+        ("malformed entries are skipped", [t["task_name"] for t in bad_merged["tasks"]] == ["Read", "Pay rent"]),
+        ("parsed plans keep only valid tasks", parsed == {"tasks": [{"task_name": "Read"}]}),
+        ("plans without a task list are rejected", parse_task_plan('{"tasks": "none"}') is None),
+    ]
+    for name, ok in checks:
+        print(f"{'✓' if ok else '✗'} {name}")
+    return all(ok for _, ok in checks)
+
+def check_resolve_questions():
+    """Check that only questions the profile really answers are answered locally"""
+    print("\nChecking clarifying question resolution...")
+    
+    from fitness import resolve_questions
+    
+    profile = {"age": "25", "weight": "70", "height": "175", "fitness_goal": "lose weight", "available_days": "3"}
+    cases = [
+        ("How old are you?\nHow many days per week can you work out?",
+         (["I am 25 years old.", "I can work out 3 days per week."], [])),
+        ("What is your goal weight?\nHow often do you eat meals?",
+         ([], ["What is your goal weight?", "How often do you eat meals?"])),
+        ("1. What is your current weight?\n2. Do you have any injuries?",
+         (["I weigh 70 kg."], ["Do you have any injuries?"])),
+        ("2. **Do you have injuries?**\n**How old are you?**",
+         (["I am 25 years old."], ["Do you have injuries?"])),
+        ("Great start! How old are you? And how tall?",
+         (["I am 25 years old.", "I am 175 cm tall."], [])),
+        ("Here is your plan.", ([], [])),
+    ]
+    failed = [text for text, expected in cases if resolve_questions(text, profile) != expected]
+    for text in failed:
+        print(f"✗ Unexpected result for {text!r}: {resolve_questions(text, profile)}")
+    if not failed:
+        print(f"✓ Question resolution: {len(cases)} cases")
+    return not failed
+
+def check_compact_messages():
+    """Check that compaction keeps the prompt under budget and keeps the first and latest turns"""
+    print("\nChecking context compaction...")
+    
+    from fitness import compact_messages
+    from tokens import estimate_tokens
+    
+    messages = [
+        {"role": "system", "content": "S" * 1200},
+        {"role": "user", "content": "P" * 400}
+    ]
+    for i in range(6):
+        messages.append({"role": "assistant", "content": f"Question {i}? " * 40})
+        messages.append({"role": "user", "content": f"Answer {i}. " * 40})
+    
+    compacted, changed = compact_messages(messages, budget=900)
+    unchanged, not_changed = compact_messages(messages[:4], budget=900)
+    checks = [
+        ("compaction happened", changed),
+        ("prompt fits the budget", estimate_tokens(compacted) <= 900),
+        ("system prompt and profile kept", compacted[:2] == messages[:2]),
+        ("latest exchange kept", compacted[-2:] == messages[-2:]),
+        ("short conversations untouched", not not_changed and unchanged == messages[:4]),
+    ]
+    for name, ok in checks:
+        print(f"{'✓' if ok else '✗'} {name}")
+    return all(ok for _, ok in checks)
+
+def check_session_store():
+    """Check session LRU eviction, TTL expiry, leases and sharing between store instances"""
+    print("\nChecking session store...")
+    
+    import time
+    import tempfile
+    from sessions import SessionStore, SessionBusyError
+    
+    db_dir = tempfile.mkdtemp()
+    
+    store = SessionStore(os.path.join(db_dir, "lru.db"), max_sessions=2, ttl=60)
+    first = store.create({"n": 1})
+    time.sleep(0.01)
+    second = store.create({"n": 2})
+    time.sleep(0.01)
+    store.get(first)
+    time.sleep(0.01)
+    third = store.create({"n": 3})
+    lru_ok = store.get(second) is None and store.get(first) is not None and store.get(third) is not None
+    
+    store = SessionStore(os.path.join(db_dir, "ttl.db"), max_sessions=10, ttl=0.05)
+    expiring = store.create({"n": 1})
+    time.sleep(0.1)
+    ttl_ok = store.get(expiring) is None
+    
+    # Two stores on one database stand in for two gunicorn workers
+    path = os.path.join(db_dir, "shared.db")
+    store, other_worker = SessionStore(path), SessionStore(path)
+    leased = store.create({"n": 1})
+    shared_ok = other_worker.get(leased) == {"n": 1}
+    busy_ok = False
+    with store.lease(leased) as session:
+        try:
+            with other_worker.lease(leased):
+                pass
+        except SessionBusyError:
+            busy_ok = session == {"n": 1}
+        session["n"] = 2
+    with other_worker.lease(leased) as session:
+        released_ok = session == {"n": 1}
+    
+    checks = [
+        ("least recently used session evicted", lru_ok),
+        ("idle session expires", ttl_ok),
+        ("sessions shared between workers", shared_ok),
+        ("concurrent turn rejected", busy_ok),
+        ("lease released, unsaved changes dropped", released_ok),
+    ]
+    for name, ok in checks:
+        print(f"{'✓' if ok else '✗'} {name}")
+    return all(ok for _, ok in checks)
+
 def main():
     """Run all tests"""
     print("EverydayAI Backend API Test Suite")
     print("=" * 40)
     
+    # Checks of local helpers, no server needed
+    checks = [
+        check_parse_traceparent,
+        check_update_task_plan,
+        check_resolve_questions,
+        check_compact_messages,
+        check_session_store
+    ]
+    
+    for check in checks:
+        if not check():
+            print("✗ Local checks failed.")
+            sys.exit(1)
+    
     # Check if server is running
     try:
         response = requests.get(f"{BASE_URL}/")
@@ -128,8 +446,12 @@ def main():
     tests = [
         test_health_endpoints,
         test_fitness_endpoint,
+        test_fitness_session_endpoint,
         test_recipe_endpoint,
-        test_taskplan_endpoint
+        test_taskplan_endpoint,
+        test_taskplan_patch_endpoint,
+        test_admin_profile_endpoint,
+        test_traceparent_header
     ]
     
     passed = 0
@@ -0,0 +1,11 @@
+def estimate_text_tokens(text):
+    """Rough token count for text, about 4 characters per token."""
+    return len(text) // 4
+
+
+def estimate_tokens(messages):
+    """
+    Rough token count for chat messages: about 4 characters per token plus a small
+    per-message overhead. Shared by prompt budgets and benchmarks so they agree.
+    """
+    return estimate_text_tokens("".join(m["content"] for m in messages)) + 4 * len(messages)
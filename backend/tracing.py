@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import threading
+import urllib.request
+import logging.handlers
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Tracing configuration
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "none").lower()  # none / file / otlp
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+OTLP_ENDPOINT = os.environ.get("OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+SERVICE_NAME = os.environ.get("SERVICE_NAME", "everydayai-backend")
+
+try:
+    TRACE_SAMPLE_RATE = min(max(float(os.environ.get("TRACE_SAMPLE_RATE", "1.0")), 0.0), 1.0)
+except ValueError:
+    logger.error("Invalid TRACE_SAMPLE_RATE, falling back to 1.0")
+    TRACE_SAMPLE_RATE = 1.0
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id=None, sampled=True, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = dict(attributes or {})
+        self.status = "OK"
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    @property
+    def traceparent(self):
+        flags = "01" if self.sampled else "00"
+        return f"00-{self.trace_id}-{self.span_id}-{flags}"
+
+    @property
+    def duration_ms(self):
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1_000_000
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        return {
+            "service": SERVICE_NAME,
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def parse_traceparent(header):
+    """Parse a W3C traceparent header into (trace_id, parent_id, sampled), or None if invalid."""
+    if not header:
+        return None
+    parts = header.strip().lower().split("-")
+    if len(parts) < 4 or parts[0] == "ff":
+        return None
+    if parts[0] == "00" and len(parts) != 4:
+        return None
+    version, trace_id, parent_id, flags = parts[:4]
+    if len(version) != 2 or len(trace_id) != 32 or len(parent_id) != 16 or len(flags) != 2:
+        return None
+    try:
+        int(trace_id, 16)
+        int(parent_id, 16)
+        sampled = bool(int(flags, 16) & 0x01)
+    except ValueError:
+        return None
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, sampled
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def span(name, traceparent=None, **attributes):
+    """Start a span as a child of the current span (or of an incoming traceparent header)."""
+    parent = _current_span.get()
+    if parent is not None:
+        trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+    else:
+        incoming = parse_traceparent(traceparent)
+        if incoming:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id = f"{random.getrandbits(128):032x}"
+            parent_id = None
+            sampled = random.random() < TRACE_SAMPLE_RATE
+
+    current = Span(name, trace_id, parent_id, sampled, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "ERROR"
+        current.set_attribute("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        if current.sampled:
+            _exporter.submit(current)
+
+
+class SpanExporter:
+    """Exports finished spans from a background thread so request handlers never block on I/O."""
+
+    def __init__(self, kind, batch_size=64, flush_interval=2.0):
+        self.kind = kind
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=10000)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, finished_span):
+        if self.kind == "none":
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(finished_span)
+        except queue.Full:
+            pass  # Drop spans rather than stall a request
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self._export(batch)
+            except Exception as e:
+                logger.error(f"Failed to export {len(batch)} spans: {e}")
+
+    def _export(self, batch):
+        if self.kind == "file":
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                for s in batch:
+                    f.write(json.dumps(s.to_dict()) + "\n")
+        elif self.kind == "otlp":
+            body = json.dumps(_to_otlp(batch)).encode("utf-8")
+            request = urllib.request.Request(
+                OTLP_ENDPOINT, data=body, headers={"Content-Type": "application/json"}, method="POST"
+            )
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+
+    def flush(self, timeout=5.0):
+        """Export whatever is still queued, used at shutdown."""
+        batch = []
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            try:
+                self._export(batch)
+            except Exception as e:
+                logger.error(f"Failed to flush {len(batch)} spans: {e}")
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _to_otlp(batch):
+    spans = []
+    for s in batch:
+        entry = {
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": 1,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+            "status": {"code": 2 if s.status == "ERROR" else 1},
+        }
+        if s.parent_id:
+            entry["parentSpanId"] = s.parent_id
+        spans.append(entry)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "everydayai.tracing"}, "spans": spans}],
+        }]
+    }
+
+
+if TRACE_EXPORTER not in ("none", "file", "otlp"):
+    logger.error(f"Unknown TRACE_EXPORTER '{TRACE_EXPORTER}', tracing export disabled")
+    TRACE_EXPORTER = "none"
+
+_exporter = SpanExporter(TRACE_EXPORTER)
+atexit.register(_exporter.flush)
+
+
+# Server loggers that keep their own handlers and do not propagate to root
+SERVER_LOGGERS = ["uvicorn", "uvicorn.error", "uvicorn.access", "gunicorn.error", "gunicorn.access"]
+
+
+class _LocalQueueHandler(logging.handlers.QueueHandler):
+    # The queue never leaves this process, so skip prepare(): formatting happens in the
+    # listener thread, and formatters that read record.args (uvicorn.access) keep working
+    def prepare(self, record):
+        return record
+
+
+def _queue_handlers(target, default_handler=None):
+    handlers = target.handlers[:] or ([default_handler] if default_handler else [])
+    if not handlers or any(isinstance(h, logging.handlers.QueueHandler) for h in handlers):
+        return None
+    for handler in handlers:
+        if handler.formatter is None:
+            handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        target.removeHandler(handler)
+
+    log_queue = queue.SimpleQueue()
+    target.addHandler(_LocalQueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def setup_queue_logging(level=logging.INFO):
+    """
+    Route logging through QueueHandlers so handlers doing I/O run off the event loop.
+
+    Root and each server logger get their own queue and listener, so records still
+    reach only the handlers they were configured with.
+    """
+    root = logging.getLogger()
+    root.setLevel(level)
+    listener = _queue_handlers(root, logging.StreamHandler())
+    for name in SERVER_LOGGERS:
+        _queue_handlers(logging.getLogger(name))
+    return listener